@@ -20,7 +20,7 @@ class Config:
     top_k: int = 4
     max_context_chars: int = 1500
     db_path: Path = Path("data/bot.db")
-    embeddings_cache: Path = Path("data/embeddings.pkl")
+    embeddings_cache: Path = Path("data/embeddings.json")
 
     @classmethod
     def load(cls) -> "Config":
@@ -42,7 +42,8 @@ class Config:
         top_k = int(os.getenv("TOP_K", "4"))
         max_context_chars = int(os.getenv("MAX_CONTEXT_CHARS", "1500"))
         db_path = Path(os.getenv("DB_PATH", "data/bot.db"))
-        embeddings_cache = Path(os.getenv("EMBEDDINGS_CACHE", "data/embeddings.pkl"))
+        # Absolute so every worker process maps the very same cache files.
+        embeddings_cache = Path(os.getenv("EMBEDDINGS_CACHE", "data/embeddings.json")).expanduser().resolve()
 
         return cls(
             openai_api_key=openai_api_key,
@@ -1,18 +1,60 @@
-import hashlib
+import asyncio
+import json
 import logging
-import pickle
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, NamedTuple
 
 import numpy as np
-from docx import Document
+import xxhash
 from openai import AsyncOpenAI
 
 from .config import Config
 
+try:
+    import faiss
+except ImportError:  # Exact search is used when FAISS is not installed.
+    faiss = None
+
 logger = logging.getLogger(__name__)
 
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_CONCURRENCY = 8
+HNSW_NEIGHBORS = 32
+HNSW_EF_SEARCH = 64
+HASH_ALGO = "xxh3_64"
+# Cache-line / AVX-512 register width, so vectorized kernels never need an unaligned prologue.
+ARRAY_ALIGNMENT = 64
+
+
+def _aligned_empty(shape: tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+    """Allocate an uninitialized C-contiguous array whose data starts on an ``ARRAY_ALIGNMENT`` boundary."""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + ARRAY_ALIGNMENT, dtype=np.uint8)
+    offset = -raw.ctypes.data % ARRAY_ALIGNMENT
+    return raw[offset : offset + nbytes].view(dtype).reshape(shape)
+
+
+def _aligned(array: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Return ``array`` as a C-contiguous, aligned array of ``dtype``, copying only when needed."""
+    array = np.ascontiguousarray(array, dtype=dtype)
+    if array.ctypes.data % ARRAY_ALIGNMENT == 0:
+        return array
+    aligned = _aligned_empty(array.shape, dtype)
+    aligned[...] = array
+    return aligned
+
+
+def _build_hnsw(normalized_embeddings: np.ndarray):
+    """Build an inner-product HNSW index, which ranks by cosine similarity on unit vectors."""
+    vectors = np.ascontiguousarray(normalized_embeddings, dtype=np.float32)
+    index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+    index.add(vectors)
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
 
 @dataclass
 class EmbeddingIndex:
@@ -20,77 +62,252 @@ class EmbeddingIndex:
     embeddings: np.ndarray
     meta: Dict[str, str]
     normalized_embeddings: np.ndarray | None = None
+    faiss_index: object | None = None
+    # Scratch buffer reused by the exact scan; it makes top_k unsafe to call from several threads.
+    _sims_buf: np.ndarray = field(init=False, repr=False)
 
     def __post_init__(self) -> None:
+        # Memory-mapped cache arrays are already contiguous and aligned (.npy pads its header to 64 bytes),
+        # so these conversions only copy freshly built or foreign-layout arrays.
+        self.embeddings = _aligned(self.embeddings, np.float32)
         if self.normalized_embeddings is None:
             norms = np.linalg.norm(self.embeddings, axis=1, keepdims=True)
-            self.normalized_embeddings = self.embeddings / np.clip(norms, 1e-10, None)
+            self.normalized_embeddings = _aligned_empty(self.embeddings.shape, np.float32)
+            np.divide(self.embeddings, np.clip(norms, 1e-10, None), out=self.normalized_embeddings)
+        else:
+            self.normalized_embeddings = _aligned(self.normalized_embeddings, np.float32)
+        if self.faiss_index is None and faiss is not None and len(self.chunks):
+            self.faiss_index = _build_hnsw(self.normalized_embeddings)
+        self._sims_buf = np.empty(len(self.chunks), dtype=np.float32)
 
     def top_k(self, query_embedding: np.ndarray, k: int) -> List[tuple[str, float]]:
-        """Return top-k chunks by cosine similarity."""
+        """Return top-k chunks by cosine similarity.
+
+        Uses the HNSW graph when FAISS is available and falls back to an exact
+        float32 scan otherwise. Not thread-safe: the scan writes into a shared buffer.
+        """
         query_norm = np.linalg.norm(query_embedding)
         if query_norm == 0 or self.normalized_embeddings is None:
             return []
-        normalized_query = query_embedding / query_norm
-        sims = self.normalized_embeddings @ normalized_query
-        top_indices = np.argsort(-sims)[:k]
+        normalized_query = (query_embedding / query_norm).astype(np.float32, copy=False)
+        if self.faiss_index is not None:
+            return self._hnsw_top_k(normalized_query, k)
+        return self._exact_top_k(normalized_query, k)
+
+    def _hnsw_top_k(self, normalized_query: np.ndarray, k: int) -> List[tuple[str, float]]:
+        query = np.ascontiguousarray(normalized_query[None, :], dtype=np.float32)
+        scores, indices = self.faiss_index.search(query, k)
+        return [(self.chunks[i], float(score)) for i, score in zip(indices[0], scores[0]) if i >= 0]
+
+    def _exact_top_k(self, normalized_query: np.ndarray, k: int) -> List[tuple[str, float]]:
+        sims = np.dot(self.normalized_embeddings, normalized_query, out=self._sims_buf)
+        n = len(sims)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        candidates = np.argpartition(sims, n - k)[n - k :]
+        top_indices = candidates[np.argsort(-sims[candidates])]
         return [(self.chunks[i], float(sims[i])) for i in top_indices]
 
 
 def _hash_text(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    # Only used for change detection, so a fast non-cryptographic hash is sufficient.
+    return xxhash.xxh3_64_hexdigest(text.encode("utf-8"))
+
+
+def _read_docx(path: Path, cache_path: Path) -> List[str]:
+    """Return the non-empty paragraphs of a DOCX file, reusing a JSON extract when the file is unchanged."""
+    source_hash = xxhash.xxh3_64_hexdigest(path.read_bytes())
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("hash_algo") == HASH_ALGO and data.get("source_hash") == source_hash:
+            return data["paragraphs"]
+    except FileNotFoundError:
+        pass
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Failed to load paragraphs cache: %s", exc)
 
+    # python-docx is slow to import and parse, so it is only loaded when the extract is stale.
+    from docx import Document
 
-def _read_docx(path: Path) -> List[str]:
     document = Document(path)
     paragraphs = [para.text.strip() for para in document.paragraphs if para.text.strip()]
+    def write(tmp_path: Path) -> None:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(
+                {"hash_algo": HASH_ALGO, "source_hash": source_hash, "paragraphs": paragraphs}, f, ensure_ascii=False
+            )
+
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        _replace_atomically(cache_path, write)
+    except OSError as exc:
+        logger.warning("Failed to save paragraphs cache: %s", exc)
     return paragraphs
 
 
 def _chunk_paragraphs(paragraphs: List[str], max_chars: int = 1200, overlap: int = 150) -> List[str]:
     """Merge paragraphs into chunks with small overlap for better embedding recall."""
+    if not paragraphs:
+        return []
+    # ends[j] is the length of paragraphs[:j + 1] joined with trailing newlines.
+    ends = np.fromiter((len(para) + 1 for para in paragraphs), dtype=np.int64, count=len(paragraphs)).cumsum()
+
     chunks: List[str] = []
-    buffer: List[str] = []
-    current_len = 0
-
-    for para in paragraphs:
-        if current_len + len(para) + 1 > max_chars and buffer:
-            chunk = "\n".join(buffer)
-            chunks.append(chunk)
-            # Keep a small overlap to maintain context.
-            overlap_text = chunk[-overlap:]
-            buffer = [overlap_text, para]
-            current_len = len(overlap_text) + len(para)
-        else:
-            buffer.append(para)
-            current_len += len(para) + 1
+    start = 0
+    overlap_text = ""
+    while start < len(paragraphs):
+        # Budget already used by the overlap carried over from the previous chunk.
+        carry = len(overlap_text) - 1 if overlap_text else 0
+        offset = int(ends[start - 1]) if start else 0
+        end = int(np.searchsorted(ends, max_chars - carry + offset, side="right"))
+        # A chunk always takes at least one paragraph, even if it alone exceeds max_chars.
+        end = max(end, start + 1)
 
-    if buffer:
-        chunks.append("\n".join(buffer))
+        chunk = "\n".join(([overlap_text] if overlap_text else []) + paragraphs[start:end])
+        chunks.append(chunk)
+        # Keep a small overlap to maintain context.
+        overlap_text = chunk[-overlap:]
+        start = end
     return chunks
 
 
+class _CacheFiles(NamedTuple):
+    meta: Path
+    embeddings: Path
+    normalized: Path
+    hnsw: Path
+
+    def exist(self) -> bool:
+        # The HNSW index is optional: it is rebuilt from the vectors when missing.
+        return all(path.exists() for path in self if path != self.hnsw)
+
+
+def _cache_files(cache_path: Path) -> _CacheFiles:
+    """Return the JSON sidecar and array file paths that make up an embeddings cache."""
+    return _CacheFiles(
+        meta=cache_path.with_suffix(".json"),
+        embeddings=cache_path.with_suffix(".npy"),
+        normalized=cache_path.with_suffix(".normalized.npy"),
+        hnsw=cache_path.with_suffix(".faiss"),
+    )
+
+
+def _replace_atomically(path: Path, write) -> None:
+    """Write ``path`` via a temporary sibling and ``os.replace`` it into place.
+
+    Other processes may have the old file memory-mapped; replacing the directory entry
+    leaves their mapping intact instead of truncating the file underneath them.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _save_array(path: Path, array: np.ndarray) -> None:
+    def write(tmp_path: Path) -> None:
+        with tmp_path.open("wb") as f:
+            np.save(f, array, allow_pickle=False)
+
+    _replace_atomically(path, write)
+
+
+def _save_hnsw(path: Path, index) -> None:
+    _replace_atomically(path, lambda tmp_path: faiss.write_index(index, str(tmp_path)))
+
+
 def _load_cache(cache_path: Path, expected_hash: str, model: str) -> EmbeddingIndex | None:
-    if not cache_path.exists():
+    files = _cache_files(cache_path)
+    if not files.exist():
         return None
     try:
-        with cache_path.open("rb") as f:
-            data = pickle.load(f)
+        with files.meta.open("r", encoding="utf-8") as f:
+            data = json.load(f)
         meta = data.get("meta", {})
-        if meta.get("doc_hash") != expected_hash or meta.get("model") != model:
+        if (
+            meta.get("hash_algo") != HASH_ALGO
+            or meta.get("doc_hash") != expected_hash
+            or meta.get("model") != model
+        ):
+            return None
+        # Memory-map the matrices so they are paged in on demand instead of copied onto the heap.
+        embeddings = np.load(files.embeddings, mmap_mode="r")
+        normalized_embeddings = np.load(files.normalized, mmap_mode="r")
+        if embeddings.shape[0] != len(data["chunks"]) or normalized_embeddings.shape != embeddings.shape:
             return None
-        embeddings = np.array(data["embeddings"], dtype=np.float32)
-        return EmbeddingIndex(chunks=data["chunks"], embeddings=embeddings, meta=meta)
+        faiss_index = None
+        if faiss is not None and files.hnsw.exists():
+            # Map the graph's vector storage instead of reading it onto the heap, so workers share it too.
+            faiss_index = faiss.read_index(str(files.hnsw), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+            if faiss_index.ntotal != embeddings.shape[0]:
+                faiss_index = None
+        index = EmbeddingIndex(
+            chunks=data["chunks"],
+            embeddings=embeddings,
+            meta=meta,
+            normalized_embeddings=normalized_embeddings,
+            faiss_index=faiss_index,
+        )
     except Exception as exc:  # noqa: BLE001
         logger.warning("Failed to load embedding cache: %s", exc)
         return None
 
+    if faiss_index is None and index.faiss_index is not None:
+        # The graph was rebuilt from the cached vectors; persist it so the next start can skip that.
+        # Failing to save it must not discard the otherwise valid cache.
+        try:
+            _save_hnsw(files.hnsw, index.faiss_index)
+        except (OSError, RuntimeError) as exc:  # FAISS reports I/O failures as RuntimeError.
+            logger.warning("Failed to save rebuilt HNSW index: %s", exc)
+    return index
+
 
 def _save_cache(cache_path: Path, index: EmbeddingIndex) -> None:
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    payload = {"chunks": index.chunks, "embeddings": index.embeddings, "meta": index.meta}
-    with cache_path.open("wb") as f:
-        pickle.dump(payload, f)
+    files = _cache_files(cache_path)
+    files.meta.parent.mkdir(parents=True, exist_ok=True)
+    _save_array(files.embeddings, np.asarray(index.embeddings, dtype=np.float32))
+    _save_array(files.normalized, np.asarray(index.normalized_embeddings, dtype=np.float32))
+    if index.faiss_index is not None:
+        _save_hnsw(files.hnsw, index.faiss_index)
+    else:
+        # A graph left over from an earlier document could match the new chunk count and be reused.
+        files.hnsw.unlink(missing_ok=True)
+
+    # Written last so a partially saved cache never validates.
+    def write_meta(tmp_path: Path) -> None:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump({"chunks": index.chunks, "meta": index.meta}, f, ensure_ascii=False)
+
+    _replace_atomically(files.meta, write_meta)
+
+
+async def _embed_chunks(
+    chunks: List[str],
+    client: AsyncOpenAI,
+    model: str,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+) -> List[List[float]]:
+    """Embed chunks in concurrent batches, returning vectors in the original chunk order."""
+    # Group chunks of similar length so each request carries a comparable token count.
+    order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]), reverse=True)
+    batches = [order[start : start + batch_size] for start in range(0, len(order), batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+    embeddings: List[List[float] | None] = [None] * len(chunks)
+
+    async def embed_batch(batch: List[int]) -> None:
+        async with semaphore:
+            response = await client.embeddings.create(model=model, input=[chunks[i] for i in batch])
+        for item in response.data:
+            embeddings[batch[item.index]] = item.embedding
+        logger.debug("Embedded batch of %d chunks", len(batch))
+
+    await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    return embeddings  # type: ignore[return-value]
 
 
 async def build_or_load_embeddings(config: Config, client: AsyncOpenAI) -> EmbeddingIndex:
@@ -98,7 +315,7 @@ async def build_or_load_embeddings(config: Config, client: AsyncOpenAI) -> Embed
     if not config.doc_path.exists():
         raise FileNotFoundError(f"Document not found at {config.doc_path}")
 
-    paragraphs = _read_docx(config.doc_path)
+    paragraphs = _read_docx(config.doc_path, config.embeddings_cache.with_suffix(".paragraphs.json"))
     if not paragraphs:
         raise ValueError("The provided DOCX file is empty.")
 
@@ -112,17 +329,20 @@ async def build_or_load_embeddings(config: Config, client: AsyncOpenAI) -> Embed
         return cached
 
     logger.info("No valid cache found. Building embeddings from %s ...", config.doc_path)
-    embeddings: List[List[float]] = []
-    for idx, chunk in enumerate(chunks, start=1):
-        response = await client.embeddings.create(model=config.embedding_model, input=chunk)
-        embeddings.append(response.data[0].embedding)
-        logger.debug("Embedded chunk %d/%d", idx, len(chunks))
+    embeddings = await _embed_chunks(chunks, client, config.embedding_model)
 
     index = EmbeddingIndex(
         chunks=chunks,
         embeddings=np.array(embeddings, dtype=np.float32),
-        meta={"doc_hash": doc_hash, "model": config.embedding_model, "source": str(config.doc_path)},
+        meta={
+            "doc_hash": doc_hash,
+            "hash_algo": HASH_ALGO,
+            "model": config.embedding_model,
+            "source": str(config.doc_path),
+        },
     )
     _save_cache(config.embeddings_cache, index)
     logger.info("Saved embeddings cache to %s", config.embeddings_cache)
-    return index
+    # Serve from the memory-mapped files so this process shares pages with other workers instead of
+    # keeping a private heap copy of the freshly built matrices.
+    return _load_cache(config.embeddings_cache, expected_hash=doc_hash, model=config.embedding_model) or index
@@ -1,29 +1,45 @@
 import logging
+from collections import OrderedDict
 from textwrap import shorten
-from typing import List
+from typing import AsyncIterator, List
 
 import numpy as np
 from openai import AsyncOpenAI
 
 from .config import Config
 from .embeddings import EmbeddingIndex
+from .translation import LANGUAGE_SETTINGS
 
 logger = logging.getLogger(__name__)
 
+QUERY_CACHE_SIZE = 1024
+
 
 class QAEngine:
     def __init__(self, config: Config, index: EmbeddingIndex, client: AsyncOpenAI):
         self.config = config
         self.index = index
         self.client = client
+        self._query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
 
     async def _embed_query(self, question: str) -> np.ndarray:
+        """Embed a question, reusing cached vectors for repeated questions."""
+        key = " ".join(question.lower().split())
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return cached
+
         response = await self.client.embeddings.create(model=self.config.embedding_model, input=question)
-        return np.array(response.data[0].embedding, dtype=np.float32)
+        embedding = np.array(response.data[0].embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        self._query_cache[key] = embedding
+        if len(self._query_cache) > QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return embedding
 
-    async def answer(self, question_uzbek: str) -> str:
-        """Answer a question in Uzbek using retrieval-augmented generation."""
-        query_embedding = await self._embed_query(question_uzbek)
+    async def _build_messages(self, question: str, user_language: str, retrieval_query: str) -> List[dict]:
+        query_embedding = await self._embed_query(retrieval_query)
         top_contexts = self.index.top_k(query_embedding, k=self.config.top_k)
 
         context_blocks: List[str] = []
@@ -34,29 +50,42 @@ class QAEngine:
         if not context_text:
             context_text = "Hujjatdan mos keladigan ma'lumot topilmadi."
 
+        language_label = LANGUAGE_SETTINGS.get(user_language, {}).get("label", user_language)
         system_prompt = (
             "Siz Time2Bank loyihasi bo'yicha savollarga javob beruvchi yordamchisiz. "
-            "Faqat berilgan kontekstdan foydalaning va javobni o'zbek tilida aniq hamda batafsil yozing. "
-            "Agar kontekstda ma'lumot bo'lmasa, rostini ayting va to'qimang."
+            "Faqat berilgan kontekstdan foydalaning va javobni aniq hamda batafsil yozing. "
+            "Agar kontekstda ma'lumot bo'lmasa, rostini ayting va to'qimang. "
+            f"The question may be in another language. Reply in {language_label}."
         )
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {
                 "role": "user",
                 "content": (
                     f"Kontekst:\n{context_text}\n\n"
-                    f"Savol: {question_uzbek}\n\n"
+                    f"Savol: {question}\n\n"
                     "Ko'rsatilgan kontekstga tayanib javob bering."
                 ),
             },
         ]
 
-        response = await self.client.chat.completions.create(
+    async def answer_stream(
+        self, question: str, user_language: str = "uz", retrieval_query: str | None = None
+    ) -> AsyncIterator[str]:
+        """Stream answer text deltas in the user's language as the model generates them.
+
+        ``retrieval_query`` is the Uzbek form of the question used to search the Uzbek
+        document; it defaults to the question itself.
+        """
+        messages = await self._build_messages(question, user_language, retrieval_query or question)
+        stream = await self.client.chat.completions.create(
             model=self.config.qa_model,
             messages=messages,
             temperature=0.2,
+            stream=True,
         )
-        answer = response.choices[0].message.content.strip()
-        logger.debug("Answered question: %s", shorten(question_uzbek, 120))
-        return answer
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        logger.debug("Answered question: %s", shorten(question, 120))
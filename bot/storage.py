@@ -1,26 +1,64 @@
 import asyncio
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
 
 from openpyxl import Workbook
 
 
+def utc_timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
 class BotStorage:
     """Simple SQLite storage for users and question counts."""
 
+    # SQL statements used by the storage methods, kept together for readability.
+    _UPSERT_USER_SQL = """
+        INSERT INTO users (chat_id, username, first_name, last_name, language, question_count, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET
+            username=excluded.username,
+            first_name=excluded.first_name,
+            last_name=excluded.last_name,
+            language=COALESCE(excluded.language, users.language),
+            updated_at=excluded.updated_at;
+    """
+
+    _INCREMENT_QUESTION_COUNT_SQL = """
+        UPDATE users
+        SET question_count = question_count + 1,
+            updated_at = ?
+        WHERE chat_id = ?;
+    """
+
+    _RECORD_QUESTION_SQL = """
+        INSERT INTO questions (chat_id, question, answer, asked_at)
+        VALUES (?, ?, ?, ?);
+    """
+
+    _EXPORT_USERS_SQL = """
+        SELECT chat_id, username, first_name, last_name, language, question_count, created_at, updated_at
+        FROM users
+        ORDER BY updated_at DESC;
+    """
+
     def __init__(self, db_path: Path):
         self.db_path = db_path
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # One shared autocommit connection; writes arrive from asyncio.to_thread workers, so guard it with a lock.
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
         self._init_db()
 
-    def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        return conn
-
     def _init_db(self) -> None:
-        with self._connect() as conn:
+        with self._lock:
+            conn = self._conn
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("PRAGMA temp_store=MEMORY;")
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS users (
@@ -47,84 +85,60 @@ class BotStorage:
                 );
                 """
             )
-            conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
 
     async def upsert_user(
         self, chat_id: int, username: str | None, first_name: str | None, last_name: str | None, language: str | None
     ) -> None:
-        await asyncio.to_thread(self._upsert_user, chat_id, username, first_name, last_name, language)
+        await asyncio.to_thread(self._upsert_user, chat_id, username, first_name, last_name, language, utc_timestamp())
 
     def _upsert_user(
-        self, chat_id: int, username: str | None, first_name: str | None, last_name: str | None, language: str | None
+        self,
+        chat_id: int,
+        username: str | None,
+        first_name: str | None,
+        last_name: str | None,
+        language: str | None,
+        now: str,
     ) -> None:
-        now = datetime.utcnow().isoformat()
-        with self._connect() as conn:
-            conn.execute(
-                """
-                INSERT INTO users (chat_id, username, first_name, last_name, language, question_count, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, 0, ?, ?)
-                ON CONFLICT(chat_id) DO UPDATE SET
-                    username=excluded.username,
-                    first_name=excluded.first_name,
-                    last_name=excluded.last_name,
-                    language=COALESCE(excluded.language, users.language),
-                    updated_at=excluded.updated_at;
-                """,
-                (chat_id, username, first_name, last_name, language, now, now),
-            )
-            conn.commit()
+        with self._lock:
+            self._conn.execute(self._UPSERT_USER_SQL, (chat_id, username, first_name, last_name, language, now, now))
 
-    async def increment_question_count(self, chat_id: int) -> None:
-        await asyncio.to_thread(self._increment_question_count, chat_id)
+    async def increment_question_count(self, chat_id: int, now: str | None = None) -> None:
+        await asyncio.to_thread(self._increment_question_count, chat_id, now or utc_timestamp())
 
-    def _increment_question_count(self, chat_id: int) -> None:
-        now = datetime.utcnow().isoformat()
-        with self._connect() as conn:
-            conn.execute(
-                """
-                UPDATE users
-                SET question_count = question_count + 1,
-                    updated_at = ?
-                WHERE chat_id = ?;
-                """,
-                (now, chat_id),
-            )
-            conn.commit()
+    def _increment_question_count(self, chat_id: int, now: str) -> None:
+        with self._lock:
+            self._conn.execute(self._INCREMENT_QUESTION_COUNT_SQL, (now, chat_id))
 
-    async def record_question(self, chat_id: int, question: str, answer: str) -> None:
-        await asyncio.to_thread(self._record_question, chat_id, question, answer)
+    async def record_question(self, chat_id: int, question: str, answer: str, asked_at: str | None = None) -> None:
+        await asyncio.to_thread(self._record_question, chat_id, question, answer, asked_at or utc_timestamp())
 
-    def _record_question(self, chat_id: int, question: str, answer: str) -> None:
-        with self._connect() as conn:
-            conn.execute(
-                """
-                INSERT INTO questions (chat_id, question, answer, asked_at)
-                VALUES (?, ?, ?, ?);
-                """,
-                (chat_id, question, answer, datetime.utcnow().isoformat()),
-            )
-            conn.commit()
+    def _record_question(self, chat_id: int, question: str, answer: str, asked_at: str) -> None:
+        with self._lock:
+            self._conn.execute(self._RECORD_QUESTION_SQL, (chat_id, question, answer, asked_at))
 
     async def export_stats(self, path: Path) -> Path:
         return await asyncio.to_thread(self._export_stats, path)
 
     def _export_stats(self, path: Path) -> Path:
-        with self._connect() as conn:
-            users = conn.execute(
-                """
-                SELECT chat_id, username, first_name, last_name, language, question_count, created_at, updated_at
-                FROM users
-                ORDER BY updated_at DESC;
-                """
-            ).fetchall()
-
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "Users"
         headers = ["chat_id", "username", "first_name", "last_name", "language", "question_count", "created_at", "updated_at"]
+        # Write-only mode streams rows straight to the file instead of keeping every cell in memory.
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Users")
         sheet.append(headers)
-        for row in users:
-            sheet.append([row[h] for h in headers])
+
+        # Read through a separate read-only connection: under WAL it sees a consistent snapshot
+        # without holding the write lock, so questions keep being recorded while the export runs.
+        reader = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            for row in reader.execute(self._EXPORT_USERS_SQL):
+                sheet.append(row)
+        finally:
+            reader.close()
 
         path.parent.mkdir(parents=True, exist_ok=True)
         workbook.save(path)
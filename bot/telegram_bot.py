@@ -3,6 +3,7 @@ import logging
 from dataclasses import dataclass
 from pathlib import Path
 
+import httpx
 from openai import AsyncOpenAI
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
@@ -16,22 +17,35 @@ from telegram.ext import (
 )
 
 from .config import Config
-from .embeddings import EmbeddingIndex, build_or_load_embeddings
+from .embeddings import build_or_load_embeddings
 from .qa import QAEngine
-from .storage import BotStorage
+from .storage import BotStorage, utc_timestamp
 from .translation import LANGUAGE_SETTINGS, TranslationService
 
 logger = logging.getLogger(__name__)
 
+# Minimum seconds between edits of a streaming answer; Telegram throttles bursts of edits per chat.
+STREAM_EDIT_INTERVAL = 1.0
+
 
 @dataclass
 class Services:
     config: Config
+    openai_client: AsyncOpenAI
     translator: TranslationService
     qa_engine: QAEngine
     storage: BotStorage
 
 
+def create_openai_client(config: Config) -> AsyncOpenAI:
+    """Create an OpenAI client backed by a keep-alive HTTP/2 connection pool."""
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+    return AsyncOpenAI(api_key=config.openai_api_key, http_client=http_client)
+
+
 def language_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [
@@ -95,17 +109,43 @@ async def handle_question(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     user_question = update.message.text
     try:
-        uz_question = await services.translator.to_uzbek(user_question, source_language=language)
-        uz_answer = await services.qa_engine.answer(uz_question)
-        if language != "uz":
-            answer = await services.translator.translate(uz_answer, target_language=language, source_language="uz")
-        else:
-            answer = uz_answer
-
-        await services.storage.increment_question_count(update.effective_user.id)
-        await services.storage.record_question(update.effective_user.id, user_question, answer)
-
-        await update.message.reply_text(answer)
+        # Retrieval runs on the Uzbek document, so search with an Uzbek query (a no-op for Uzbek users).
+        # The answer itself is generated directly in the user's language, without a back-translation.
+        retrieval_query = await services.translator.to_uzbek(user_question, source_language=language)
+
+        # Send the answer as it streams in, editing one message instead of waiting for the full completion.
+        loop = asyncio.get_running_loop()
+        reply = None
+        sent_text = ""
+        last_edit = 0.0
+        answer = ""
+        async for delta in services.qa_engine.answer_stream(
+            user_question, user_language=language, retrieval_query=retrieval_query
+        ):
+            answer += delta
+            partial = answer.strip()
+            # Skip unchanged text (e.g. a whitespace-only delta): Telegram rejects no-op edits.
+            if not partial or partial == sent_text or loop.time() - last_edit < STREAM_EDIT_INTERVAL:
+                continue
+            if reply is None:
+                reply = await update.message.reply_text(partial)
+            else:
+                await reply.edit_text(partial)
+            sent_text = partial
+            last_edit = loop.time()
+
+        answer = answer.strip()
+        # Bookkeeping does not affect the reply, so persist it while the final text is being sent.
+        now = utc_timestamp()
+        pending = [
+            services.storage.increment_question_count(update.effective_user.id, now=now),
+            services.storage.record_question(update.effective_user.id, user_question, answer, asked_at=now),
+        ]
+        if reply is None:
+            pending.append(update.message.reply_text(answer))
+        elif answer != sent_text:
+            pending.append(reply.edit_text(answer))
+        await asyncio.gather(*pending)
         await update.message.reply_text(LANGUAGE_SETTINGS[language]["ask_more"])
     except Exception as exc:  # noqa: BLE001
         logger.exception("Failed to answer question: %s", exc)
@@ -128,24 +168,48 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     logger.exception("Update '%s' caused error: %s", update, context.error)
 
 
-async def _build_index(config: Config) -> EmbeddingIndex:
-    client = AsyncOpenAI(api_key=config.openai_api_key)
-    return await build_or_load_embeddings(config, client)
+async def _startup(application: Application) -> None:
+    """Build the index and services on the polling loop so the OpenAI client stays bound to it."""
+    config: Config = application.bot_data["config"]
+    openai_client = create_openai_client(config)
+    logger.info("Loading embeddings from %s", config.doc_path)
+    try:
+        index = await build_or_load_embeddings(config, openai_client)
+    except BaseException:
+        # Services are never stored in this case, so _shutdown cannot close the client for us.
+        await openai_client.close()
+        raise
+
+    translator = TranslationService(config=config, client=openai_client)
+    qa_engine = QAEngine(config=config, index=index, client=openai_client)
+    storage = BotStorage(config.db_path)
+    application.bot_data["services"] = Services(
+        config=config,
+        openai_client=openai_client,
+        translator=translator,
+        qa_engine=qa_engine,
+        storage=storage,
+    )
 
 
-def build_application() -> Application:
-    config = Config.load()
-    logging.info("Loading embeddings from %s", config.doc_path)
-    index = asyncio.run(_build_index(config))
+async def _shutdown(application: Application) -> None:
+    services: Services | None = application.bot_data.get("services")
+    if services is None:
+        return
+    await services.openai_client.close()
+    services.storage.close()
 
-    runtime_client = AsyncOpenAI(api_key=config.openai_api_key)
-    translator = TranslationService(config=config, client=runtime_client)
-    qa_engine = QAEngine(config=config, index=index, client=runtime_client)
-    storage = BotStorage(config.db_path)
-    services = Services(config=config, translator=translator, qa_engine=qa_engine, storage=storage)
 
-    application = ApplicationBuilder().token(config.telegram_bot_token).build()
-    application.bot_data["services"] = services
+def build_application() -> Application:
+    config = Config.load()
+    application = (
+        ApplicationBuilder()
+        .token(config.telegram_bot_token)
+        .post_init(_startup)
+        .post_shutdown(_shutdown)
+        .build()
+    )
+    application.bot_data["config"] = config
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -158,7 +222,4 @@ def build_application() -> Application:
 
 def run_bot() -> None:
     application = build_application()
-    # Ensure a fresh event loop is set before running polling (required on Python 3.11+).
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
     application.run_polling()